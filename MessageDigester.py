@@ -1,661 +1,1022 @@
-import asyncio
-from datetime import datetime, timezone
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import json
-import logging
-from logging.handlers import TimedRotatingFileHandler
-import os
-import re
-import smtplib
-import sys
-from typing import Any, TypedDict, Optional
-
-import discord
-from discord.ext import commands, tasks
-from dotenv import load_dotenv
-
-# Configure logging
-logger = logging.getLogger("MessageDigester")
-
-def generate_log_filename(prefix: str = "log", extension: str = ".log") -> str:
-    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    return f"{prefix}_{timestamp}{extension}"
-
-logging.basicConfig(
-    level=logging.INFO,  # Set log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-    format='%(asctime)s - %(levelname)s - %(message)s',  # Timestamp prefix format
-    datefmt='%Y-%m-%d %H:%M:%S',  # Concise timestamp format
-    handlers=[
-        TimedRotatingFileHandler(
-            filename=generate_log_filename(),
-            when="midnight",  # Rotate at midnight daily
-            interval=1,  # Every 1 day
-            backupCount=10,  # Keep up to 10 backup files
-            encoding="utf-8",
-            delay=False
-        ),
-        logging.FileHandler(generate_log_filename()),  # Log to file with timestamped name
-        logging.StreamHandler()  # Also log to console
-    ]
-)
-
-logger.info("Started")
-
-# Load bot config variables from environment
-load_dotenv()
-
-# The discord token is used to log the bot in to discord.
-DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
-if not DISCORD_TOKEN:
-    logger.error(f"DISCORD_TOKEN not present in .env - quitting")
-    sys.exit()
-
-# Interval at which to create a digest from all messages posted
-# since the last digest.
-DEFAULT_DIGEST_INTERVAL_MINUTES = int(os.getenv('DEFAULT_DIGEST_INTERVAL_MINUTES') or '1440')    # Default to 24 hours
-# Interval between running the main loop to check if digests need to be generated.
-MAIN_LOOP_INTERVAL_SEC = int(os.getenv('MAIN_LOOP_INTERVAL_SEC') or '60') # Default to 60 seconds
-# File to store configurations for each server
-CONFIG_FILE = os.getenv('CONFIG_FILE') or 'bot_config.json'
-
-# If EMAIL_SENDER_EMAIL is not present don't send emails
-EMAIL_SENDER_EMAIL = os.getenv('EMAIL_SENDER_EMAIL')
-EMAIL_SENDER_PASSWORD = os.getenv('EMAIL_SENDER_PASSWORD')
-EMAIL_SMTP_SERVER = os.getenv('EMAIL_SMTP_SERVER') or 'NO SMTP SERVER!!'
-EMAIL_SMTP_PORT = int(os.getenv('EMAIL_SMTP_PORT') or '587')
-
-# Initialize bot
-intents = discord.Intents.default()
-intents.message_content = True  # Needed for reading message content
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-# Represents the server config stored in the JSON config file
-class ServerConfig(TypedDict):
-    channels: list[int]
-    digest_interval: int
-    last_digest: Optional[datetime]
-
-def make_email_file_path(serverId : int) -> str:
-    return f'{serverId}.emails'
-
-# Load a list of email addresses from a file, one email per line.
-def load_emails_from_file(serverId : int) -> list[str]:
-    filePath = make_email_file_path(serverId)
-
-    if not os.path.exists(filePath):
-        return []
-    
-    with open(filePath, 'r') as file:
-        # Read lines, strip whitespace, and filter out empty lines
-        emails = [line.strip() for line in file if line.strip()]
-
-    # deduplicate
-    dedupEmails = list(dict.fromkeys(emails))
-
-    if len(dedupEmails) != len(emails):
-        write_emails_to_file(serverId, dedupEmails)
-
-    return dedupEmails
-
-# Write a list of email addresses to a file, one email per line.
-def write_emails_to_file(serverId : int, emails : list[str]):
-    filePath = make_email_file_path(serverId)
-
-    with open(filePath, 'w') as file:
-        for email in emails:
-            file.write(f"{email}\n")
-    
-def save_emails(emails : dict[int, list[str]]):
-    for serverId in emails:
-        write_emails_to_file(serverId, emails[serverId])
-
-# Load digest configurations from file
-def load_config() -> dict[int,ServerConfig]:
-    logger.info(f"Loading config from: {os.path.abspath(CONFIG_FILE)}...")
-    if not os.path.exists(CONFIG_FILE):
-        logger.info(f"{os.path.abspath(CONFIG_FILE)} does not exist - creating...")
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump({}, f)
-            return {}
-    else:
-        with open(CONFIG_FILE, 'r') as f:
-            tmp = json.load(f)
-            # Convert keys from string to int
-            config = {int(key): value for key, value in tmp.items()}
-            # Convert last_digest back to datetime for each server
-            for server_id in config:
-                if 'last_digest' in config[server_id] and config[server_id]['last_digest']:
-                    config[server_id]['last_digest'] = datetime.fromisoformat(config[server_id]['last_digest'])
-
-            return config
-    return {}
-
-# Save configurations to file
-def save_config(configs : dict[int, Any]):
-    data = {}
-    for server_id, conf in configs.items():
-        data[server_id] = conf.copy()
-        if 'last_digest' in conf and conf['last_digest']:
-            data[server_id]['last_digest'] = conf['last_digest'].isoformat()
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(data, f)
-    
-# Get a discord server's name from its ID.
-def get_server_name_from_id(server_id: int) -> str:
-    try:
-        guild = bot.get_guild(server_id)
-        if guild is None:
-            # If guild not in cache, try fetching it
-            guild = asyncio.run(bot.fetch_guild(server_id))
-        if guild.name:
-            return guild.name
-    except discord.errors.Forbidden:
-        logger.exception(f"Bot lacks permission to access server with ID {server_id}")
-    except discord.errors.HTTPException as e:
-        logger.exception(f"Error fetching server with ID {server_id}: {e}")
-    
-    return "NO SERVER NAME"
-
-# Generate a server identifier (name/ID) to use in logging
-def server_log_name(server_id : int) -> str:
-    return f'"{get_server_name_from_id(server_id)}"/{server_id}'
-
-# Load the configs and email lists for each server
-try:
-    configs = load_config()
-    email_lists : dict[int,list[str]] = {}
-    for serverId in configs:
-        email_lists[serverId] = load_emails_from_file(serverId)
-except Exception as e:
-    logger.exception(f"An error occurred: {str(e)}")
-
-# Main loop that periodically checks to see if a new
-# digest needs to be generated.
-@tasks.loop(seconds=MAIN_LOOP_INTERVAL_SEC)
-async def digest_check():
-    if not configs:
-        logger.info("No servers have been configured")
-        return
-        
-    try:
-        now = datetime.now(timezone.utc)
-        for server_id, conf in list(configs.items()):  # Copy to avoid runtime changes
-            if 'last_digest' not in conf or not conf['last_digest']:
-                conf['last_digest'] = now
-                continue
-            elapsed_minutes = (now - conf['last_digest']).total_seconds() / 60
-            if elapsed_minutes >= conf.get('digest_interval', DEFAULT_DIGEST_INTERVAL_MINUTES):
-                await generate_digest(server_id)
-                conf['last_digest'] = now
-                save_config(configs)
-
-    except Exception as e:
-        logger.exception(f"An error occurred: {str(e)}")
-
-# Group messages according to the window of time in which they occurred.
-# Grouped messages will be rendered to the digest under their timestamp.
-# This avoids polluting the digest with lots of timestamps.
-def group_messages_by_timestamp(messages : list[discord.Message]) -> dict[str, list[discord.Message]]:
-    msgGroups : dict[str, list[discord.Message]] = {}
-
-    for msg in messages:
-        # Timestamp granularity is minute, so messages
-        # will be grouped under the minute in which they occurred.
-        # Use local time zone.
-        timestamp = msg.created_at.astimezone().strftime('%a %b %d %I:%M %p')
-        if timestamp not in msgGroups:
-            msgGroups[timestamp] = []
-            
-        msgGroups[timestamp].append(msg)
-
-    return msgGroups
-
-def send_email(sender_email: str, sender_password: str, recipient_list: list[str], 
-               subject: str, body: str, content_type: str = 'html', 
-               smtp_server: str = "smtp.gmail.com", smtp_port: int = 587) -> bool:
-    """
-    Send an email to a list of recipients via SMTP with undisclosed recipients.
-    Supports both standard password and Gmail's app-specific password authentication.
-
-    Args:
-        sender_email (str): Sender's email address
-        sender_password (str): Sender's email password or app-specific password for Gmail
-        recipient_list (List[str]): List of recipient email addresses
-        subject (str): Email subject
-        body (str): Email body content (HTML or plain text)
-        content_type (str): MIME type of the body ('html' or 'plain', default: 'html')
-        smtp_server (str): SMTP server address (default: Gmail)
-        smtp_port (int): SMTP server port (default: 587 for TLS)
-
-    Returns:
-        bool: True if email sent successfully, False otherwise
-
-    Note:
-        - For Gmail with 2FA enabled, generate an app-specific password at:
-          https://myaccount.google.com/security (under "Signing in to Google" > "App passwords").
-    """
-    try:
-        # Validate content_type
-        if content_type not in ['html', 'plain']:
-            raise ValueError("content_type must be 'html' or 'plain'")
-
-        # Create the email message
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = "Undisclosed Recipients <undisclosed-recipients@no-reply.com>"
-        msg['Subject'] = subject
-        
-        # Add body to email with specified content type
-        msg.attach(MIMEText(body, content_type))
-
-        # Set up the SMTP server
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()  # Enable TLS
-
-        # Authenticate using the provided credentials
-        # For Gmail, app-specific password is used the same way as a regular password
-        server.login(sender_email, sender_password)
-
-        # Send email to all recipients as BCC
-        server.sendmail(sender_email, recipient_list, msg.as_string())
-        
-        # Close the connection
-        server.quit()
-        return True
-    
-    except Exception as e:
-        print(f"Failed to send email: {str(e)}")
-        return False
-
-def render_digest_to_html(serverName: str, digest: dict[str, dict[str, list[discord.Message]]]) -> str:
-    html = '<html><body style="font-family: Arial, sans-serif;">\n'
-    # Add page title with server name
-    html += f'<h1>Digest for {serverName}</h1>\n'
-    
-    for channel_name, message_groups in digest.items():
-        # Add channel header
-        html += f'<h2>#{channel_name}</h2>\n'
-        
-        for timestamp, messages in message_groups.items():
-            # Convert timestamp string to datetime and format
-            try:
-                dt = datetime.fromisoformat(timestamp)
-                formatted_time = dt.strftime("%a %b %d %I:%M %p")
-            except ValueError:
-                formatted_time = timestamp  # Fallback if timestamp isn't valid ISO format
-            
-            # Add timestamp header
-            html += f'<h3>{formatted_time}</h3>\n'
-            
-            # Check if message group is empty
-            if not messages:
-                html += '<p>No new messages</p>\n'
-            else:
-                html += '<ul>\n'
-                # Add each message in the group
-                for message in messages:
-                    author = message.author.name
-                    content = message.content.replace('<', '&lt;').replace('>', '&gt;')  # Escape HTML characters
-                    
-                    # Initialize thumbnail and embed HTML
-                    thumbnail_html = ''
-                    embed_html = ''
-                    
-                    # Check for attachments and add thumbnails
-                    for attachment in message.attachments:
-                        if attachment.url:
-                            thumbnail_html += f'<br><img src="{attachment.url}" alt="Attachment Thumbnail" style="max-width: 200px; max-height: 200px; object-fit: cover;" onerror="this.style.display=\'none\'">'
-                    
-                    # Check for stickers and add thumbnails or name based on format
-                    for sticker_item in message.stickers:
-                        if sticker_item.id:
-                            # Render Lottie stickers as their name, others as images
-                            if sticker_item.format == discord.StickerFormatType.lottie:
-                                thumbnail_html += f'<br><p>Sticker: {sticker_item.name.replace("<", "&lt;").replace(">", "&gt;")}</p>'
-                            else:
-                                sticker_url = f"https://cdn.discordapp.com/stickers/{sticker_item.id}.png?size=320"
-                                thumbnail_html += f'<br><img src="{sticker_url}" alt="Sticker" style="max-width: 200px; max-height: 200px; object-fit: cover;" onerror="this.style.display=\'none\'">'
-                        else:
-                            # Fallback in case sticker ID is unavailable
-                            thumbnail_html += f'<br><p>Unable to load sticker: {sticker_item.name.replace("<", "&lt;").replace(">", "&gt;")}</p>'
-                    
-                    # Check for embeds and add formatted content
-                    for embed in message.embeds:
-                        embed_content = ''
-                        if embed.title:
-                            # Make title a clickable link if embed.url exists, otherwise just strong text
-                            title_text = embed.title.replace('<', '&lt;').replace('>', '&gt;')
-                            if embed.url:
-                                embed_content += f'<a href="{embed.url}" style="text-decoration: none; color: #0066cc; display: block;"><strong>{title_text}</strong></a>'
-                            else:
-                                embed_content += f'<strong style="display: block; word-wrap: break-word;">{title_text}</strong>'
-                        if embed.description:
-                            embed_content += f'<p style="margin: 0; word-wrap: break-word;">{embed.description.replace("<", "&lt;").replace(">", "&gt;")}</p>'
-                        if embed.thumbnail and embed.thumbnail.url:
-                            embed_content += f'<img src="{embed.thumbnail.url}" alt="Embed Thumbnail" style="max-width: 200px; max-height: 200px; object-fit: cover; display: block; margin-top: 10px;" onerror="this.style.display=\'none\'">'
-                        if embed_content:
-                            embed_html += f'<div style="width: 200px; padding: 10px; border-left: 2px solid #ccc; box-sizing: border-box;">{embed_content}</div>'
-                    
-                    html += f'    <li><strong>{author}:</strong> {content}{thumbnail_html}{embed_html}</li>\n'
-                html += '</ul>\n'
-    
-    html += '</body></html>'
-    return html
-
-async def generate_digest(server_id : int):
-    try:
-        logger.info(f"Generating digest for server {server_log_name(server_id)}...")
-
-        conf = configs.get(server_id)
-        if not conf or 'channels' not in conf or not conf['channels']:
-            logger.info(f"No channels configured for server {server_log_name(server_id)}")
-            return
-        
-        serverName = get_server_name_from_id(server_id)
-
-        haveNewMessages = False
-
-        # For each channel collect messages and group them
-        # by timestamp
-
-        digest : dict[str, dict[str,list[discord.Message]]] = {}
-        
-        for channel_id in conf['channels']:
-            channel = bot.get_channel(channel_id)
-            if not channel:
-                continue
-
-            # Tell type checker that channel is a TextChannel
-            assert isinstance(channel, discord.TextChannel), "Expected a TextChannel"
-
-            digest[get_channel_name(channel_id)] = {}
-
-            # Fetch messages since last digest, oldest first to maintain time ordering
-            messages = [msg async for msg in channel.history(after=conf['last_digest'], oldest_first=True, limit = None)]
-
-            if not messages:
-                continue
-
-            digest[get_channel_name(channel_id)] = msgGroups = group_messages_by_timestamp(messages)
-
-            # If no messages don't add to the digest
-            if not msgGroups:
-                continue
-            
-            haveNewMessages = True
-
-        if(not haveNewMessages):
-            logger.info(f"No new messages on server {server_log_name(server_id)}.")
-            return
-        
-        logger.info(f"Writing messages from server {server_log_name(server_id)} to digest...")
-
-        now = datetime.now()
-        
-        baseFilename = f"digest_{server_id}_{now.astimezone(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
-
-        # Save to HTML file
-        html = render_digest_to_html(serverName, digest)
-        htmlFilename = f"{baseFilename}.html"
-        with open(htmlFilename, 'w', encoding='utf-8') as f:
-            f.write(html)
-
-        logger.info(f"Generated HTML digest {htmlFilename} for server {server_log_name(server_id)}")
-
-        # Send HTML-formatted email to recipient list
-
-        if not EMAIL_SENDER_EMAIL or not EMAIL_SENDER_PASSWORD:
-            logger.info(f"Email disabled for {server_log_name(server_id)} - no email will be sent")
-            return
-
-        if server_id not in email_lists or not email_lists[server_id]:
-            logger.info(f"No email recipients for {server_log_name(server_id)}")
-            return
-
-        logger.info(f"Sending digest email for server {server_log_name(server_id)}...")
-
-        recipientList = email_lists[server_id]
-    
-        subject = f"Discord Message Digest for {serverName} - {now.astimezone().strftime('%a %b %d %I:%M %p')}"
-        send_email(EMAIL_SENDER_EMAIL, EMAIL_SENDER_PASSWORD, recipientList, subject, html)
-
-        logger.info("Email sent")
-
-    except Exception as e:
-        logger.exception(f"An error occurred: {str(e)}")
-
-# Return the server ID.
-def get_server_id(ctx : commands.Context[commands.Bot]) -> int:
-    assert ctx.guild is not None  # Tell type checker ctx.guild is not None
-    return ctx.guild.id  # Guild ID is the server ID
-
-# Return the name of the channel associated with the channel ID.
-def get_channel_name(channelId : int) -> str:
-    channel = bot.get_channel(channelId)
-
-    # Tell type checker that channel is a TextChannel
-    assert isinstance(channel, discord.TextChannel), "Expected a TextChannel"
-
-    return channel.name
-
-SERVER_CONFIG_TEMPLATE: ServerConfig = {
-    'channels': [],
-    'digest_interval': DEFAULT_DIGEST_INTERVAL_MINUTES,
-    'last_digest': None
-}
-
-# If a server config doesn't exist populate it with a default config
-def populate_server_config(server_id : int):
-    if not server_id in configs or not configs[server_id]:
-        configs[server_id] = SERVER_CONFIG_TEMPLATE.copy()
-
-    config = configs[server_id]
-    
-    # If the config exists it might not have all the fields if new fields have
-    # been added since the config was created.
-    for key, value in SERVER_CONFIG_TEMPLATE.items():
-        if key not in config:
-            config[key] = value
-    
-################################
-# Bot Commands
-################################
-
-# add_channel
-# Adds a channel to be monitored for new messages.
-# Usage
-#   !add_channel
-#
-# Called from the channel to add.
-#
-@bot.command(name='add_channel',brief='Adds the current channel to be monitored for new messages')
-@commands.has_permissions(administrator=True)
-@commands.guild_only()  # Restrict command to guilds only
-async def add_channel(ctx : commands.Context[commands.Bot]):
-    try:
-        if not isinstance(ctx.channel, discord.TextChannel):
-            await ctx.send(f'Only text channels can be monitored.')
-            return
-
-        channelName = get_channel_name(ctx.channel.id)
-
-        server_id = get_server_id(ctx)
-
-        populate_server_config(server_id)
-
-        if ctx.channel.id not in configs[server_id]['channels']:
-            configs[server_id]['channels'].append(ctx.channel.id)
-            save_config(configs)
-            await ctx.send(f'Added channel #{channelName} to monitored channels.')
-            logger.info(f'Added channel #{channelName} to monitored channels on server {server_log_name(server_id)}.')
-        else:
-            await ctx.send(f'Channel #{channelName} is already monitored.')
-    except Exception as e:
-        logger.exception(f"An error occurred: {str(e)}")
-
-# remove_channel
-# Removes a channel from the list of channels to be monitored.
-# Usage
-#   !remove_channel
-#
-# Called from the channel to remove.
-#
-@bot.command(name='remove_channel',brief='Removes the current channel from the list of monitored channels')
-@commands.has_permissions(administrator=True)
-@commands.guild_only()  # Restrict command to guilds only
-async def remove_channel(ctx : commands.Context[commands.Bot]):
-    try:
-        if not isinstance(ctx.channel, discord.TextChannel):
-            await ctx.send(f'Only text channels can be monitored.')
-            return
-        
-        channelName = get_channel_name(ctx.channel.id)
-        
-        server_id = get_server_id(ctx)
-        if server_id in configs and ctx.channel.id in configs[server_id]['channels']:
-            configs[server_id]['channels'].remove(ctx.channel.id)
-            save_config(configs)
-            await ctx.send(f'Removed channel #{channelName} from monitored channels.')
-            logger.info(f'Removed channel #{channelName} from monitored channels {server_log_name(server_id)}.')
-        else:
-            await ctx.send(f'Channel #{channelName} is not being monitored.')
-    except Exception as e:
-        logger.exception(f"An error occurred: {str(e)}")
-
-# set_interval
-# Sets the interval at which to check for new messages.
-# Usage
-#   !set_interval <minutes>
-#
-# Called from any channel.
-#
-@bot.command(name='set_interval',brief='Sets the interval at which to check for new messages')
-@commands.has_permissions(administrator=True)
-@commands.guild_only()  # Restrict command to guilds only
-async def set_interval(ctx : commands.Context[commands.Bot], minutes: int):
-    try:
-        if minutes < 1:
-            await ctx.send('Interval must be at least 1 minute.')
-            return
-        server_id = get_server_id(ctx)
-
-        populate_server_config(server_id)
-
-        configs[server_id]['digest_interval'] = minutes
-        save_config(configs)
-        await ctx.send(f'Digest interval set to {minutes} minutes.')
-        logger.info(f'Digest interval set to {minutes} minutes on server {server_log_name(server_id)}.')
-    except Exception as e:
-        logger.exception(f"An error occurred: {str(e)}")
-
-# Regular expression for basic email validation
-EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
-
-def normalize_email(email : str) -> str:
-    return email.strip().lower()
-
-def validate_email(email : str) -> Optional[str]:
-    normalized = normalize_email(email)
-    if EMAIL_PATTERN.match(normalized):
-        return normalized
-
-    return None
-
-# upload_emails
-# Uploads email recipients from an attached file.
-# Usage
-#   !upload_emails <file_attachment>
-#
-# The attached file must contain a list of valid email addresses,
-# with one email address per line.
-#
-# Called from any channel.
-#
-@bot.command(name='upload_emails',brief='Uploads email recipients from an attached file')
-@commands.has_permissions(administrator=True)
-@commands.guild_only()  # Restrict command to guilds only
-async def upload_emails(ctx : commands.Context[commands.Bot], file : discord.Attachment):
-    try:
-        content = await file.read()
-
-        recipientsToAdd = [line.strip() for line in content.decode('utf-8').splitlines() if line.strip()]
-
-        if not recipientsToAdd:
-            await ctx.send(f'Email recipient list not updated')
-            return
-        
-        emailsToAdd : list[str] = []
-
-        for recipient in recipientsToAdd:
-            validatedEmail = validate_email(recipient)
-            if validatedEmail:
-                emailsToAdd.append(validatedEmail)
-            else:
-                await ctx.send(f'"{recipient}" is an invalid email')
-
-        if not emailsToAdd:
-            await ctx.send(f'Email recipient list not updated')
-            return
-                
-        server_id = get_server_id(ctx)
-
-        if not email_lists[server_id]:
-            email_lists[server_id] = []
-
-        # Merge lists and remove duplicates
-        email_lists[server_id] = list(dict.fromkeys(emailsToAdd + email_lists[server_id]))
-
-        save_emails(email_lists)
-
-        await ctx.send(f'Email recipient list updated')
-        logger.info(f'Email recipient list updated on server {server_log_name(server_id)}.')
-    except Exception as e:
-        logger.exception(f"An error occurred: {str(e)}")
-
-# show_config
-# Prints the configuration for the server.
-# Usage
-#   !show_config
-#
-# Called from any channel.
-#
-@bot.command(name='show_config',brief='Prints the configuration for the server')
-@commands.has_permissions(administrator=True)
-@commands.guild_only()  # Restrict command to guilds only
-async def show_config(ctx : commands.Context[commands.Bot]):
-    try:
-        server_id = get_server_id(ctx)
-        if server_id not in configs:
-            await ctx.send('No configuration set yet.')
-            return
-        
-        conf = configs[server_id]
-
-        # KV pairs excluding 'channels'
-        configStr = '\n'.join(f"{key}: {value}" for key, value in conf.items() if key != 'channels')
-        # Special treatment for 'channels' to convert channel IDs to strings
-        channels = ', '.join([get_channel_name(ch_id) for ch_id in conf.get('channels', []) if bot.get_channel(ch_id)]) or 'None'
-        
-        await ctx.send(f'channels: {channels}\n{configStr}')
-    except Exception as e:
-        logger.exception(f"An error occurred: {str(e)}")
-
-# Run the bot
-
-@bot.event
-async def on_ready():
-    logger.info(f'Logged in as {bot.user}')
-    digest_check.start()  # Start the periodic check for digests
-
-@bot.event
-async def on_disconnect():
-    logger.warning(f"B{bot.user}ot disconnected from Discord.")
-
-@bot.event
-async def on_command_error(ctx: commands.Context[commands.Bot], error: commands.CommandError):
-    logger.error(f"Command error: {error}")
-    await ctx.send(f"Command error: {error}.")
-
-logger.info("Starting bot...")
-bot.run(DISCORD_TOKEN)
\ No newline at end of file
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import heapq
+from html import escape as _esc
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+import json
+import logging
+from logging.handlers import TimedRotatingFileHandler
+import os
+import re
+import smtplib
+import sys
+import threading
+from typing import Any, Iterator, TypedDict, Optional
+
+import discord
+from discord.ext import commands, tasks
+from dotenv import load_dotenv
+
+# Use orjson for config IO when available - several times faster than
+# stdlib json and produces bytes directly. OPT_NON_STR_KEYS is needed
+# because configs are keyed by int server ID.
+try:
+    import orjson
+
+    def _json_dumps(obj : Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj : Any) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+    _json_loads = json.loads
+
+# Configure logging
+logger = logging.getLogger("MessageDigester")
+
+def generate_log_filename(prefix: str = "log", extension: str = ".log") -> str:
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    return f"{prefix}_{timestamp}{extension}"
+
+logging.basicConfig(
+    level=logging.INFO,  # Set log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+    format='%(asctime)s - %(levelname)s - %(message)s',  # Timestamp prefix format
+    datefmt='%Y-%m-%d %H:%M:%S',  # Concise timestamp format
+    handlers=[
+        TimedRotatingFileHandler(
+            filename=generate_log_filename(),
+            when="midnight",  # Rotate at midnight daily
+            interval=1,  # Every 1 day
+            backupCount=10,  # Keep up to 10 backup files
+            encoding="utf-8",
+            delay=False
+        ),
+        logging.StreamHandler()  # Also log to console
+    ]
+)
+
+logger.info("Started")
+
+# Load bot config variables from environment
+load_dotenv()
+
+# The discord token is used to log the bot in to discord.
+DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
+if not DISCORD_TOKEN:
+    logger.error(f"DISCORD_TOKEN not present in .env - quitting")
+    sys.exit()
+
+# Interval at which to create a digest from all messages posted
+# since the last digest.
+DEFAULT_DIGEST_INTERVAL_MINUTES = int(os.getenv('DEFAULT_DIGEST_INTERVAL_MINUTES') or '1440')    # Default to 24 hours
+# Interval between running the main loop to check if digests need to be generated.
+MAIN_LOOP_INTERVAL_SEC = int(os.getenv('MAIN_LOOP_INTERVAL_SEC') or '60') # Default to 60 seconds
+# Interval between flushing dirty config changes to disk.
+CONFIG_FLUSH_INTERVAL_SEC = int(os.getenv('CONFIG_FLUSH_INTERVAL_SEC') or '5') # Default to 5 seconds
+# Cap on messages collected per channel per digest so a long outage
+# backlog can't grow memory without bound.
+MAX_MESSAGES_PER_CHANNEL = int(os.getenv('MAX_MESSAGES_PER_CHANNEL') or '10000') # Default to 10k messages
+# File to store configurations for each server
+CONFIG_FILE = os.getenv('CONFIG_FILE') or 'bot_config.json'
+
+# If EMAIL_SENDER_EMAIL is not present don't send emails
+EMAIL_SENDER_EMAIL = os.getenv('EMAIL_SENDER_EMAIL')
+EMAIL_SENDER_PASSWORD = os.getenv('EMAIL_SENDER_PASSWORD')
+EMAIL_SMTP_SERVER = os.getenv('EMAIL_SMTP_SERVER') or 'NO SMTP SERVER!!'
+EMAIL_SMTP_PORT = int(os.getenv('EMAIL_SMTP_PORT') or '587')
+
+# Initialize bot
+intents = discord.Intents.default()
+intents.message_content = True  # Needed for reading message content
+bot = commands.Bot(command_prefix='!', intents=intents)
+
+# Represents the server config stored in the JSON config file
+class ServerConfig(TypedDict):
+    channels: list[int]
+    digest_interval: int
+    last_digest: Optional[datetime]
+    _schema_version: int
+
+def make_email_file_path(serverId : int) -> str:
+    return f'{serverId}.emails'
+
+# Load a list of email addresses from a file, one email per line.
+def load_emails_from_file(serverId : int) -> list[str]:
+    filePath = make_email_file_path(serverId)
+
+    if not os.path.exists(filePath):
+        return []
+    
+    with open(filePath, 'r') as file:
+        # Read lines, strip whitespace, and filter out empty lines
+        emails = [line.strip() for line in file if line.strip()]
+
+    # deduplicate
+    dedupEmails = list(dict.fromkeys(emails))
+
+    if len(dedupEmails) != len(emails):
+        write_emails_to_file(serverId, dedupEmails)
+
+    return dedupEmails
+
+# Write a list of email addresses to a file, one email per line.
+def write_emails_to_file(serverId : int, emails : list[str]):
+    filePath = make_email_file_path(serverId)
+
+    with open(filePath, 'w') as file:
+        for email in emails:
+            file.write(f"{email}\n")
+    
+def save_emails(emails : dict[int, list[str]]):
+    for serverId in emails:
+        write_emails_to_file(serverId, emails[serverId])
+
+# Parsed config cached in-process. The in-memory structure is canonical
+# after startup - the file is only consulted on cold start.
+_config_cache : Optional[dict[int,ServerConfig]] = None
+# Serialized form of the config as last written, used by save_config to
+# skip the write when nothing material has changed.
+_last_written_blob : Optional[bytes] = None
+
+# Load digest configurations from file
+def load_config() -> dict[int,ServerConfig]:
+    global _config_cache
+    if _config_cache is not None:
+        return _config_cache
+
+    logger.info(f"Loading config from: {os.path.abspath(CONFIG_FILE)}...")
+    if not os.path.exists(CONFIG_FILE):
+        logger.info(f"{os.path.abspath(CONFIG_FILE)} does not exist - creating...")
+        with open(CONFIG_FILE, 'wb') as f:
+            f.write(_json_dumps({}))
+        _config_cache = {}
+    else:
+        with open(CONFIG_FILE, 'rb') as f:
+            tmp = _json_loads(f.read())
+            # Convert keys from string to int
+            config = {int(key): value for key, value in tmp.items()}
+            # Convert last_digest back to datetime for each server
+            for server_id in config:
+                if 'last_digest' in config[server_id] and config[server_id]['last_digest']:
+                    config[server_id]['last_digest'] = datetime.fromisoformat(config[server_id]['last_digest'])
+
+            _config_cache = config
+
+    return _config_cache
+
+# Build a detached, serializable snapshot of the configs. Must run on
+# the event loop: command handlers mutate configs and the nested
+# channels lists, so copying here keeps a worker thread from ever
+# seeing a half-updated structure.
+def _snapshot_config(configs : dict[int, Any]) -> dict[int, Any]:
+    data = {}
+    for server_id, conf in configs.items():
+        entry = conf.copy()
+        if 'channels' in conf and conf['channels'] is not None:
+            # conf.copy() is shallow - copy the list so a concurrent
+            # add_channel can't tear the snapshot mid-serialization
+            entry['channels'] = list(conf['channels'])
+        if 'last_digest' in conf and conf['last_digest']:
+            entry['last_digest'] = conf['last_digest'].isoformat()
+        data[server_id] = entry
+    return data
+
+# Serialize a snapshot and write it to the config file. Safe to run on
+# a worker thread because the snapshot is detached from live state.
+def _write_config_snapshot(data : dict[int, Any]):
+    global _last_written_blob
+
+    blob = _json_dumps(data)
+    # Skip the write when the serialized config hasn't changed
+    if blob == _last_written_blob:
+        return
+
+    # Write to a temp file and atomically replace so a crash mid-write
+    # can't leave a truncated config behind.
+    tmpFile = f'{CONFIG_FILE}.tmp'
+    with open(tmpFile, 'wb') as f:
+        f.write(blob)
+    os.replace(tmpFile, CONFIG_FILE)
+    _last_written_blob = blob
+
+# Save configurations to file
+def save_config(configs : dict[int, Any]):
+    _write_config_snapshot(_snapshot_config(configs))
+
+# Set when the in-memory config has changed and needs flushing to disk.
+_config_dirty = False
+
+# Mark the config as needing a flush. Command handlers call this instead
+# of save_config so a burst of commands results in a single write.
+def mark_config_dirty():
+    global _config_dirty
+    _config_dirty = True
+
+# Debounced config writer. Flushes at most once per interval, off the
+# event loop, instead of rewriting the file on every command.
+@tasks.loop(seconds=CONFIG_FLUSH_INTERVAL_SEC)
+async def flush_config():
+    global _config_dirty
+    if not _config_dirty:
+        return
+    _config_dirty = False
+    try:
+        # Snapshot on the event loop; only the (thread-safe) serialize
+        # and file write are handed to the worker thread
+        data = _snapshot_config(configs)
+        await asyncio.to_thread(_write_config_snapshot, data)
+    except Exception as e:
+        # Leave the flag set so the next tick retries the write
+        _config_dirty = True
+        logger.exception(f"An error occurred: {str(e)}")
+    
+# Caches of guild/channel names keyed by ID so repeated lookups during a
+# digest cycle don't re-resolve through the discord.py cache (or worse,
+# an HTTP fetch) for every log line. Entries are invalidated by the
+# on_guild_update/on_guild_channel_update listeners below.
+_guild_name_cache : dict[int, str] = {}
+_channel_name_cache : dict[int, str] = {}
+
+# Get a discord server's name from its ID using cached data only.
+# Safe to call from sync contexts - never touches the network.
+def get_cached_server_name(server_id: int) -> str:
+    cached = _guild_name_cache.get(server_id)
+    if cached is not None:
+        return cached
+
+    guild = bot.get_guild(server_id)
+    if guild and guild.name:
+        _guild_name_cache[server_id] = guild.name
+        return guild.name
+
+    return "NO SERVER NAME"
+
+# Resolve a server's name, fetching over HTTP when it isn't in the
+# discord.py cache and populating the name cache on success. Must be
+# awaited - calling asyncio.run from the running event loop would raise.
+async def resolve_server_name(server_id : int) -> str:
+    cached = _guild_name_cache.get(server_id)
+    if cached is not None:
+        return cached
+
+    try:
+        guild = bot.get_guild(server_id)
+        if guild is None:
+            # If guild not in cache, try fetching it
+            guild = await bot.fetch_guild(server_id)
+        if guild.name:
+            _guild_name_cache[server_id] = guild.name
+            return guild.name
+    except discord.errors.Forbidden:
+        logger.exception(f"Bot lacks permission to access server with ID {server_id}")
+    except discord.errors.HTTPException as e:
+        logger.exception(f"Error fetching server with ID {server_id}: {e}")
+
+    return "NO SERVER NAME"
+
+# Generate a server identifier (name/ID) to use in logging
+def server_log_name(server_id : int) -> str:
+    return f'"{get_cached_server_name(server_id)}"/{server_id}'
+
+# Load the configs and email lists for each server
+try:
+    configs = load_config()
+    email_lists : dict[int,list[str]] = {}
+    for serverId in configs:
+        email_lists[serverId] = load_emails_from_file(serverId)
+except Exception as e:
+    logger.exception(f"An error occurred: {str(e)}")
+
+# Min-heap of (next_fire_utc, server_id) deadlines so digest_check only
+# peeks the earliest entry instead of scanning every server each tick.
+# Rescheduling (e.g. !set_interval) leaves the old entry in the heap;
+# _scheduled_fire records each server's live deadline so stale
+# duplicates are dropped when popped instead of re-pushed forever.
+_digest_heap : list[tuple[datetime, int]] = []
+_scheduled_fire : dict[int, datetime] = {}
+
+# Schedule a server's next digest deadline, superseding any earlier one.
+def _schedule_digest(server_id : int, when : datetime):
+    _scheduled_fire[server_id] = when
+    heapq.heappush(_digest_heap, (when, server_id))
+
+# Compute when a server's next digest is due, counting from `since`.
+def _next_fire(conf : ServerConfig, since : datetime) -> datetime:
+    return since + timedelta(minutes=conf.get('digest_interval', DEFAULT_DIGEST_INTERVAL_MINUTES))
+
+# Seed the digest schedule from the loaded configs. Servers that have
+# never digested are scheduled immediately so last_digest gets stamped
+# on the first tick, matching the old scan behavior.
+now = datetime.now(timezone.utc)
+# Snapshot keys only - values aren't copied since only last_digest is
+# ever mutated, never the key set we're iterating.
+for server_id in tuple(configs):
+    conf = configs[server_id]
+    last = conf.get('last_digest')
+    _schedule_digest(server_id, _next_fire(conf, last) if last else now)
+
+# Main loop that periodically checks to see if a new
+# digest needs to be generated.
+@tasks.loop(seconds=MAIN_LOOP_INTERVAL_SEC)
+async def digest_check():
+    if not configs:
+        logger.info("No servers have been configured")
+        return
+
+    try:
+        now = datetime.now(timezone.utc)
+        while _digest_heap and _digest_heap[0][0] <= now:
+            when, server_id = heapq.heappop(_digest_heap)
+
+            if _scheduled_fire.get(server_id) != when:
+                # Stale duplicate superseded by a reschedule - drop it
+                continue
+
+            conf = configs.get(server_id)
+            if conf is None:
+                # Server was removed after this entry was scheduled
+                del _scheduled_fire[server_id]
+                continue
+
+            if 'last_digest' not in conf or not conf['last_digest']:
+                conf['last_digest'] = now
+                _schedule_digest(server_id, _next_fire(conf, now))
+                continue
+
+            due = _next_fire(conf, conf['last_digest'])
+            if due > now:
+                # The interval grew since this entry was scheduled -
+                # push the real deadline.
+                _schedule_digest(server_id, due)
+                continue
+
+            await generate_digest(server_id)
+            conf['last_digest'] = now
+            mark_config_dirty()
+            _schedule_digest(server_id, _next_fire(conf, now))
+
+    except Exception as e:
+        logger.exception(f"An error occurred: {str(e)}")
+
+# Group messages according to the window of time in which they occurred.
+# Grouped messages will be rendered to the digest under their timestamp.
+# This avoids polluting the digest with lots of timestamps.
+def group_messages_by_timestamp(messages : list[discord.Message]) -> dict[int, list[discord.Message]]:
+    msgGroups : defaultdict[int, list[discord.Message]] = defaultdict(list)
+
+    for msg in messages:
+        # Timestamp granularity is minute, so messages
+        # will be grouped under the minute in which they occurred.
+        # Bucket by integer minute - much cheaper than strftime per
+        # message; the bucket is formatted once at render time.
+        bucket = int(msg.created_at.timestamp()) // 60
+        msgGroups[bucket].append(msg)
+
+    # Downstream code expects a plain dict
+    return dict(msgGroups)
+
+# Pools a single persistent SMTP connection so each digest email doesn't
+# pay a fresh TCP+TLS handshake and AUTH round-trip.
+class SmtpPool:
+    def __init__(self, smtp_server : str, smtp_port : int, sender_email : str, sender_password : str):
+        self._server = smtp_server
+        self._port = smtp_port
+        self._email = sender_email
+        self._password = sender_password
+        self._conn : Optional[smtplib.SMTP] = None
+        # Serializes all use of the connection - smtplib is not
+        # thread-safe and sends and keep-alive pings run on different
+        # to_thread workers. Reentrant so drop() can be called from a
+        # send that already holds it.
+        self.lock = threading.RLock()
+
+    # Return a connected, authenticated SMTP client, dialing lazily on
+    # first use or after the connection has been dropped.
+    def get(self) -> smtplib.SMTP:
+        if self._conn is None:
+            conn = smtplib.SMTP(self._server, self._port)
+            conn.starttls()  # Enable TLS
+            conn.login(self._email, self._password)
+            self._conn = conn
+        return self._conn
+
+    # Discard the pooled connection so the next get() reconnects.
+    def drop(self):
+        with self.lock:
+            if self._conn is not None:
+                try:
+                    self._conn.quit()
+                except Exception:
+                    pass
+                self._conn = None
+
+    # Keep-alive ping; drops a dead connection so the next send redials.
+    def ping(self):
+        # Skip the ping if a send holds the lock - the connection is
+        # clearly alive, and a NOOP mid-transaction would corrupt the
+        # command/response pairing.
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if self._conn is None:
+                return
+            try:
+                self._conn.noop()
+            except Exception:
+                self.drop()
+        finally:
+            self.lock.release()
+
+_smtp_pool : Optional[SmtpPool] = None
+
+# Periodically ping the pooled SMTP connection so the server doesn't
+# time out the session between digests.
+@tasks.loop(minutes=5)
+async def smtp_keepalive():
+    if _smtp_pool is not None:
+        await asyncio.to_thread(_smtp_pool.ping)
+
+def send_email(sender_email: str, sender_password: str, recipient_list: list[str], 
+               subject: str, body: str, content_type: str = 'html', 
+               smtp_server: str = "smtp.gmail.com", smtp_port: int = 587) -> bool:
+    """
+    Send an email to a list of recipients via SMTP with undisclosed recipients.
+    Supports both standard password and Gmail's app-specific password authentication.
+
+    Args:
+        sender_email (str): Sender's email address
+        sender_password (str): Sender's email password or app-specific password for Gmail
+        recipient_list (List[str]): List of recipient email addresses
+        subject (str): Email subject
+        body (str): Email body content (HTML or plain text)
+        content_type (str): MIME type of the body ('html' or 'plain', default: 'html')
+        smtp_server (str): SMTP server address (default: Gmail)
+        smtp_port (int): SMTP server port (default: 587 for TLS)
+
+    Returns:
+        bool: True if email sent successfully, False otherwise
+
+    Note:
+        - For Gmail with 2FA enabled, generate an app-specific password at:
+          https://myaccount.google.com/security (under "Signing in to Google" > "App passwords").
+    """
+    try:
+        # Validate content_type
+        if content_type not in ['html', 'plain']:
+            raise ValueError("content_type must be 'html' or 'plain'")
+
+        # Create the email message
+        msg = MIMEMultipart()
+        msg['From'] = sender_email
+        msg['To'] = "Undisclosed Recipients <undisclosed-recipients@no-reply.com>"
+        msg['Subject'] = subject
+        
+        # Add body to email with specified content type
+        msg.attach(MIMEText(body, content_type))
+
+        # Send through the pooled connection, dialing lazily on first use.
+        # For Gmail, app-specific password is used the same way as a regular password
+        global _smtp_pool
+        if _smtp_pool is None:
+            _smtp_pool = SmtpPool(smtp_server, smtp_port, sender_email, sender_password)
+
+        # Hold the pool lock across connect+send so the keep-alive
+        # ping can't interleave with the SMTP transaction.
+        with _smtp_pool.lock:
+            # Retry once if the pooled connection has gone stale
+            for attempt in range(2):
+                try:
+                    server = _smtp_pool.get()
+                    # Send email to all recipients as BCC
+                    server.sendmail(sender_email, recipient_list, msg.as_string())
+                    return True
+                except smtplib.SMTPServerDisconnected:
+                    _smtp_pool.drop()
+
+        logger.error("Failed to send email: SMTP server disconnected on both attempts")
+        return False
+    
+    except Exception as e:
+        print(f"Failed to send email: {str(e)}")
+        return False
+
+# Blocking file IO, run via asyncio.to_thread from generate_digest
+# so the event loop stays responsive. Writing consumes the fragment
+# iterator chunk by chunk, so peak memory is one fragment, not the
+# whole document.
+def _write_file_chunks(filePath : str, chunks : Iterator[str]):
+    with open(filePath, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+def _read_file(filePath : str) -> str:
+    with open(filePath, 'r', encoding='utf-8') as f:
+        return f.read()
+
+# Static style fragments reused for every thumbnail in the digest
+_THUMB_STYLE = 'max-width: 200px; max-height: 200px; object-fit: cover;'
+_HIDE_ON_ERROR = 'onerror="this.style.display=\'none\'"'
+# Hoisted out of the per-message loop: the enum lookup and CDN URL
+# template otherwise cost attribute loads on every sticker.
+_LOTTIE = discord.StickerFormatType.lottie
+_STICKER_CDN = 'https://cdn.discordapp.com/stickers/{}.png?size=320'
+
+# Yields the digest HTML as fragments so callers can stream it to disk
+# without ever holding the whole document in memory.
+def iter_digest_html(serverName: str, digest: dict[str, dict[int, list[discord.Message]]],
+                     truncatedChannels: set[str]) -> Iterator[str]:
+    yield '<html><body style="font-family: Arial, sans-serif;">\n'
+    # Add page title with server name
+    yield f'<h1>Digest for {serverName}</h1>\n'
+
+    for channel_name, message_groups in digest.items():
+        # Add channel header
+        yield f'<h2>#{channel_name}</h2>\n'
+
+        if channel_name in truncatedChannels:
+            yield f'<p><em>&hellip;older messages omitted (per-channel cap of {MAX_MESSAGES_PER_CHANNEL} reached)&hellip;</em></p>\n'
+
+        for bucket, messages in message_groups.items():
+            # Format the minute bucket once per group, in local time
+            formatted_time = datetime.fromtimestamp(bucket * 60).strftime('%a %b %d %I:%M %p')
+
+            # Add timestamp header
+            yield f'<h3>{formatted_time}</h3>\n'
+
+            # Check if message group is empty
+            if not messages:
+                yield '<p>No new messages</p>\n'
+            else:
+                yield '<ul>\n'
+                # Add each message in the group
+                for message in messages:
+                    author = message.author.name
+                    content = _esc(message.content, quote=False)  # Escape HTML characters
+
+                    # Initialize thumbnail and embed HTML
+                    thumbnail_html = ''
+                    embed_html = ''
+
+                    # Check for attachments and add thumbnails
+                    for attachment in message.attachments:
+                        if attachment.url:
+                            thumbnail_html += f'<br><img src="{attachment.url}" alt="Attachment Thumbnail" style="{_THUMB_STYLE}" {_HIDE_ON_ERROR}>'
+
+                    # Check for stickers and add thumbnails or name based on format
+                    for sticker_item in message.stickers:
+                        if sticker_item.id:
+                            # Render Lottie stickers as their name, others as images
+                            if sticker_item.format is _LOTTIE:
+                                thumbnail_html += f'<br><p>Sticker: {_esc(sticker_item.name, quote=False)}</p>'
+                            else:
+                                sticker_url = _STICKER_CDN.format(sticker_item.id)
+                                thumbnail_html += f'<br><img src="{sticker_url}" alt="Sticker" style="{_THUMB_STYLE}" {_HIDE_ON_ERROR}>'
+                        else:
+                            # Fallback in case sticker ID is unavailable
+                            thumbnail_html += f'<br><p>Unable to load sticker: {_esc(sticker_item.name, quote=False)}</p>'
+
+                    # Check for embeds and add formatted content
+                    for embed in message.embeds:
+                        embed_content = ''
+                        if embed.title:
+                            # Make title a clickable link if embed.url exists, otherwise just strong text
+                            title_text = _esc(embed.title, quote=False)
+                            if embed.url:
+                                embed_content += f'<a href="{embed.url}" style="text-decoration: none; color: #0066cc; display: block;"><strong>{title_text}</strong></a>'
+                            else:
+                                embed_content += f'<strong style="display: block; word-wrap: break-word;">{title_text}</strong>'
+                        if embed.description:
+                            embed_content += f'<p style="margin: 0; word-wrap: break-word;">{_esc(embed.description, quote=False)}</p>'
+                        if embed.thumbnail and embed.thumbnail.url:
+                            embed_content += f'<img src="{embed.thumbnail.url}" alt="Embed Thumbnail" style="{_THUMB_STYLE} display: block; margin-top: 10px;" {_HIDE_ON_ERROR}>'
+                        if embed_content:
+                            embed_html += f'<div style="width: 200px; padding: 10px; border-left: 2px solid #ccc; box-sizing: border-box;">{embed_content}</div>'
+
+                    yield f'    <li><strong>{author}:</strong> {content}{thumbnail_html}{embed_html}</li>\n'
+                yield '</ul>\n'
+
+    yield '</body></html>'
+
+async def generate_digest(server_id : int):
+    try:
+        logger.info(f"Generating digest for server {server_log_name(server_id)}...")
+
+        conf = configs.get(server_id)
+        if not conf or 'channels' not in conf or not conf['channels']:
+            logger.info(f"No channels configured for server {server_log_name(server_id)}")
+            return
+        
+        serverName = await resolve_server_name(server_id)
+
+        haveNewMessages = False
+
+        # For each channel collect messages and group them
+        # by timestamp
+
+        digest : dict[str, dict[int,list[discord.Message]]] = {}
+
+        # Channels whose history hit the per-channel cap; noted in the digest
+        truncatedChannels : set[str] = set()
+
+        # Collect one channel's messages grouped by timestamp.
+        async def collect_channel(channel_id : int) -> Optional[tuple[str, dict[int,list[discord.Message]]]]:
+            channel = bot.get_channel(channel_id)
+            if not channel:
+                return None
+
+            # Tell type checker that channel is a TextChannel
+            assert isinstance(channel, discord.TextChannel), "Expected a TextChannel"
+
+            # Fetch messages since last digest, newest first and capped so
+            # a huge backlog stays bounded; the cap keeps the most recent
+            # messages. Fetch one past the cap so truncation is only
+            # flagged when messages were actually dropped, then reverse
+            # to restore time ordering.
+            messages = [msg async for msg in channel.history(after=conf['last_digest'], oldest_first=False, limit=MAX_MESSAGES_PER_CHANNEL + 1)]
+
+            channelName = get_channel_name(channel_id)
+            if len(messages) > MAX_MESSAGES_PER_CHANNEL:
+                truncatedChannels.add(channelName)
+                del messages[MAX_MESSAGES_PER_CHANNEL:]
+            messages.reverse()
+
+            return channelName, group_messages_by_timestamp(messages)
+
+        # Channels are independent, so fetch their histories concurrently.
+        # discord.py's internal rate limiter provides the backpressure.
+        results = await asyncio.gather(*[collect_channel(channel_id) for channel_id in conf['channels']],
+                                       return_exceptions=True)
+
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"Error collecting channel history: {result}")
+                continue
+            if result is None:
+                continue
+
+            channelName, msgGroups = result
+            digest[channelName] = msgGroups
+
+            if msgGroups:
+                haveNewMessages = True
+
+        if(not haveNewMessages):
+            logger.info(f"No new messages on server {server_log_name(server_id)}.")
+            return
+        
+        logger.info(f"Writing messages from server {server_log_name(server_id)} to digest...")
+
+        now = datetime.now()
+        
+        baseFilename = f"digest_{server_id}_{now.astimezone(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
+
+        # Stream the rendered digest straight to the HTML file
+        htmlFilename = f"{baseFilename}.html"
+        await asyncio.to_thread(_write_file_chunks, htmlFilename,
+                                iter_digest_html(serverName, digest, truncatedChannels))
+
+        logger.info(f"Generated HTML digest {htmlFilename} for server {server_log_name(server_id)}")
+
+        # Send HTML-formatted email to recipient list
+
+        if not EMAIL_SENDER_EMAIL or not EMAIL_SENDER_PASSWORD:
+            logger.info(f"Email disabled for {server_log_name(server_id)} - no email will be sent")
+            return
+
+        if server_id not in email_lists or not email_lists[server_id]:
+            logger.info(f"No email recipients for {server_log_name(server_id)}")
+            return
+
+        logger.info(f"Sending digest email for server {server_log_name(server_id)}...")
+
+        recipientList = email_lists[server_id]
+
+        # Read the already-written file back for the email body rather
+        # than keeping a second full copy alive through the render
+        html = await asyncio.to_thread(_read_file, htmlFilename)
+    
+        subject = f"Discord Message Digest for {serverName} - {now.astimezone().strftime('%a %b %d %I:%M %p')}"
+        # SMTP is blocking (seconds per round-trip) - keep it off the event loop
+        await asyncio.to_thread(send_email, EMAIL_SENDER_EMAIL, EMAIL_SENDER_PASSWORD, recipientList, subject, html)
+
+        logger.info("Email sent")
+
+    except Exception as e:
+        logger.exception(f"An error occurred: {str(e)}")
+
+# Return the server ID.
+def get_server_id(ctx : commands.Context[commands.Bot]) -> int:
+    assert ctx.guild is not None  # Tell type checker ctx.guild is not None
+    return ctx.guild.id  # Guild ID is the server ID
+
+# Return the name of the channel associated with the channel ID.
+def get_channel_name(channelId : int) -> str:
+    cached = _channel_name_cache.get(channelId)
+    if cached is not None:
+        return cached
+
+    channel = bot.get_channel(channelId)
+
+    # Tell type checker that channel is a TextChannel
+    assert isinstance(channel, discord.TextChannel), "Expected a TextChannel"
+
+    _channel_name_cache[channelId] = channel.name
+    return channel.name
+
+# Bump when fields are added to SERVER_CONFIG_TEMPLATE so existing
+# configs get the fill-in pass exactly once after an upgrade.
+SCHEMA_VERSION = 1
+
+SERVER_CONFIG_TEMPLATE: ServerConfig = {
+    'channels': [],
+    'digest_interval': DEFAULT_DIGEST_INTERVAL_MINUTES,
+    'last_digest': None,
+    '_schema_version': SCHEMA_VERSION
+}
+
+# If a server config doesn't exist populate it with a default config
+def populate_server_config(server_id : int):
+    if not server_id in configs or not configs[server_id]:
+        configs[server_id] = SERVER_CONFIG_TEMPLATE.copy()
+        # New server - schedule it so the next tick stamps last_digest
+        _schedule_digest(server_id, datetime.now(timezone.utc))
+
+    config = configs[server_id]
+
+    # Configs stamped with the current schema already have every field
+    if config.get('_schema_version') == SCHEMA_VERSION:
+        return
+
+    # If the config exists it might not have all the fields if new fields have
+    # been added since the config was created.
+    for key, value in SERVER_CONFIG_TEMPLATE.items():
+        if key not in config:
+            config[key] = value
+
+    config['_schema_version'] = SCHEMA_VERSION
+    
+################################
+# Bot Commands
+################################
+
+# add_channel
+# Adds a channel to be monitored for new messages.
+# Usage
+#   !add_channel
+#
+# Called from the channel to add.
+#
+@bot.command(name='add_channel',brief='Adds the current channel to be monitored for new messages')
+@commands.has_permissions(administrator=True)
+@commands.guild_only()  # Restrict command to guilds only
+async def add_channel(ctx : commands.Context[commands.Bot]):
+    try:
+        if not isinstance(ctx.channel, discord.TextChannel):
+            await ctx.send(f'Only text channels can be monitored.')
+            return
+
+        channelName = get_channel_name(ctx.channel.id)
+
+        server_id = get_server_id(ctx)
+
+        populate_server_config(server_id)
+
+        if ctx.channel.id not in configs[server_id]['channels']:
+            configs[server_id]['channels'].append(ctx.channel.id)
+            mark_config_dirty()
+            await ctx.send(f'Added channel #{channelName} to monitored channels.')
+            logger.info(f'Added channel #{channelName} to monitored channels on server {server_log_name(server_id)}.')
+        else:
+            await ctx.send(f'Channel #{channelName} is already monitored.')
+    except Exception as e:
+        logger.exception(f"An error occurred: {str(e)}")
+
+# remove_channel
+# Removes a channel from the list of channels to be monitored.
+# Usage
+#   !remove_channel
+#
+# Called from the channel to remove.
+#
+@bot.command(name='remove_channel',brief='Removes the current channel from the list of monitored channels')
+@commands.has_permissions(administrator=True)
+@commands.guild_only()  # Restrict command to guilds only
+async def remove_channel(ctx : commands.Context[commands.Bot]):
+    try:
+        if not isinstance(ctx.channel, discord.TextChannel):
+            await ctx.send(f'Only text channels can be monitored.')
+            return
+        
+        channelName = get_channel_name(ctx.channel.id)
+        
+        server_id = get_server_id(ctx)
+        if server_id in configs and ctx.channel.id in configs[server_id]['channels']:
+            configs[server_id]['channels'].remove(ctx.channel.id)
+            mark_config_dirty()
+            await ctx.send(f'Removed channel #{channelName} from monitored channels.')
+            logger.info(f'Removed channel #{channelName} from monitored channels {server_log_name(server_id)}.')
+        else:
+            await ctx.send(f'Channel #{channelName} is not being monitored.')
+    except Exception as e:
+        logger.exception(f"An error occurred: {str(e)}")
+
+# set_interval
+# Sets the interval at which to check for new messages.
+# Usage
+#   !set_interval <minutes>
+#
+# Called from any channel.
+#
+@bot.command(name='set_interval',brief='Sets the interval at which to check for new messages')
+@commands.has_permissions(administrator=True)
+@commands.guild_only()  # Restrict command to guilds only
+async def set_interval(ctx : commands.Context[commands.Bot], minutes: int):
+    try:
+        if minutes < 1:
+            await ctx.send('Interval must be at least 1 minute.')
+            return
+        server_id = get_server_id(ctx)
+
+        populate_server_config(server_id)
+
+        configs[server_id]['digest_interval'] = minutes
+        # Reschedule so a shorter interval takes effect right away
+        last = configs[server_id].get('last_digest')
+        _schedule_digest(server_id, _next_fire(configs[server_id], last) if last else datetime.now(timezone.utc))
+        mark_config_dirty()
+        await ctx.send(f'Digest interval set to {minutes} minutes.')
+        logger.info(f'Digest interval set to {minutes} minutes on server {server_log_name(server_id)}.')
+    except Exception as e:
+        logger.exception(f"An error occurred: {str(e)}")
+
+# Regular expression for basic email validation. Anchored with \A/\Z and
+# built from character classes only so matching can't backtrack
+# pathologically on crafted input.
+EMAIL_PATTERN = re.compile(r'\A[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}\Z')
+
+# Splits an uploaded recipient list on any run of commas/whitespace
+RECIPIENT_SPLIT_PATTERN = re.compile(r'[,\s]+')
+
+def normalize_email(email : str) -> str:
+    return email.strip().lower()
+
+def validate_email(email : str) -> Optional[str]:
+    normalized = normalize_email(email)
+    # RFC 5321 caps addresses at 254 octets - reject oversized input
+    # before handing it to the matcher
+    if len(normalized) > 254:
+        return None
+    if EMAIL_PATTERN.match(normalized):
+        return normalized
+
+    return None
+
+# upload_emails
+# Uploads email recipients from an attached file.
+# Usage
+#   !upload_emails <file_attachment>
+#
+# The attached file must contain a list of valid email addresses,
+# with one email address per line.
+#
+# Called from any channel.
+#
+@bot.command(name='upload_emails',brief='Uploads email recipients from an attached file')
+@commands.has_permissions(administrator=True)
+@commands.guild_only()  # Restrict command to guilds only
+async def upload_emails(ctx : commands.Context[commands.Bot], file : discord.Attachment):
+    try:
+        content = await file.read()
+
+        # Single precompiled split instead of per-line strip/filter;
+        # accepts comma-separated lists as well as one address per line
+        recipientsToAdd = [r for r in RECIPIENT_SPLIT_PATTERN.split(content.decode('utf-8').strip()) if r]
+
+        if not recipientsToAdd:
+            await ctx.send(f'Email recipient list not updated')
+            return
+        
+        emailsToAdd : list[str] = []
+
+        for recipient in recipientsToAdd:
+            validatedEmail = validate_email(recipient)
+            if validatedEmail:
+                emailsToAdd.append(validatedEmail)
+            else:
+                await ctx.send(f'"{recipient}" is an invalid email')
+
+        if not emailsToAdd:
+            await ctx.send(f'Email recipient list not updated')
+            return
+                
+        server_id = get_server_id(ctx)
+
+        if not email_lists[server_id]:
+            email_lists[server_id] = []
+
+        # Merge lists and remove duplicates in one pass, new emails
+        # first, without building a transient concatenated list
+        seen : set[str] = set()
+        merged : list[str] = []
+        for email in emailsToAdd:
+            if email not in seen:
+                seen.add(email)
+                merged.append(email)
+        for email in email_lists[server_id]:
+            if email not in seen:
+                seen.add(email)
+                merged.append(email)
+        email_lists[server_id] = merged
+
+        save_emails(email_lists)
+
+        await ctx.send(f'Email recipient list updated')
+        logger.info(f'Email recipient list updated on server {server_log_name(server_id)}.')
+    except Exception as e:
+        logger.exception(f"An error occurred: {str(e)}")
+
+# show_config
+# Prints the configuration for the server.
+# Usage
+#   !show_config
+#
+# Called from any channel.
+#
+@bot.command(name='show_config',brief='Prints the configuration for the server')
+@commands.has_permissions(administrator=True)
+@commands.guild_only()  # Restrict command to guilds only
+async def show_config(ctx : commands.Context[commands.Bot]):
+    try:
+        server_id = get_server_id(ctx)
+        if server_id not in configs:
+            await ctx.send('No configuration set yet.')
+            return
+        
+        conf = configs[server_id]
+
+        # KV pairs excluding 'channels' and internal underscore keys
+        configStr = '\n'.join(f"{key}: {value}" for key, value in conf.items()
+                               if key != 'channels' and not key.startswith('_'))
+        # Special treatment for 'channels' to convert channel IDs to strings
+        channels = ', '.join([get_channel_name(ch_id) for ch_id in conf.get('channels', []) if bot.get_channel(ch_id)]) or 'None'
+        
+        await ctx.send(f'channels: {channels}\n{configStr}')
+    except Exception as e:
+        logger.exception(f"An error occurred: {str(e)}")
+
+# Run the bot
+
+@bot.event
+async def on_ready():
+    logger.info(f'Logged in as {bot.user}')
+    # Seed the name cache so sync lookups (logging) hit on the first digest
+    for guild in bot.guilds:
+        _guild_name_cache[guild.id] = guild.name
+    # on_ready fires again after a full reconnect - don't restart
+    # loops that are already running
+    if not digest_check.is_running():
+        digest_check.start()  # Start the periodic check for digests
+    if not flush_config.is_running():
+        flush_config.start()  # Start the debounced config writer
+    if EMAIL_SENDER_EMAIL and EMAIL_SENDER_PASSWORD and not smtp_keepalive.is_running():
+        smtp_keepalive.start()  # Keep the pooled SMTP connection alive
+
+@bot.event
+async def on_guild_update(before : discord.Guild, after : discord.Guild):
+    # Drop the cached name so the next lookup picks up a rename
+    _guild_name_cache.pop(after.id, None)
+
+@bot.event
+async def on_guild_channel_update(before : discord.abc.GuildChannel, after : discord.abc.GuildChannel):
+    # Drop the cached name so the next lookup picks up a rename
+    _channel_name_cache.pop(after.id, None)
+
+@bot.event
+async def on_disconnect():
+    logger.warning(f"Bot {bot.user} disconnected from Discord.")
+
+@bot.event
+async def on_resumed():
+    # The gateway session was resumed by discord.py's built-in
+    # reconnect logic - no state was lost.
+    logger.info(f"Bot {bot.user} resumed Discord session.")
+
+@bot.event
+async def on_command_error(ctx: commands.Context[commands.Bot], error: commands.CommandError):
+    logger.error(f"Command error: {error}")
+    await ctx.send(f"Command error: {error}.")
+
+logger.info("Starting bot...")
+# reconnect=True (the default, made explicit) lets discord.py handle
+# gateway drops with exponential backoff and session resumption.
+try:
+    bot.run(DISCORD_TOKEN, reconnect=True)
+finally:
+    # Flush any config change still sitting in the debounce window so
+    # an exit can't discard an acknowledged command
+    if _config_dirty:
+        save_config(configs)
\ No newline at end of file